@@ -1,174 +1,306 @@
-import streamlit as st
-import pandas as pd
-import numpy as np
-import time
-from datetime import datetime
-import plotly.express as px
-import firebase_admin
-from firebase_admin import credentials, firestore
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table
-from reportlab.lib.pagesizes import A4
-from reportlab.lib.styles import getSampleStyleSheet
-import io
-from streamlit_autorefresh import st_autorefresh
-
-# -----------------------------
-# FIREBASE SETUP
-# -----------------------------
-if not firebase_admin._apps:
-    cred = credentials.Certificate("pmsm-25905-firebase-adminsdk-fbsvc-eb25d9aa87.json")  
-    firebase_admin.initialize_app(cred)
-db = firestore.client()
-
-st.set_page_config(page_title="PMSM Fault Diagnosis Dashboard", layout="wide")
-
-# -----------------------------
-# UTILS
-# -----------------------------
-@st.cache_data(ttl=10)
-def fetch_verdicts():
-    """Fetch all verdicts from Firestore"""
-    verdicts_ref = db.collection("verdicts").order_by("timestamp", direction=firestore.Query.DESCENDING)
-    docs = verdicts_ref.stream()
-    data = []
-    for doc in docs:
-        d = doc.to_dict()
-        if "timestamp" in d and d["timestamp"] is not None:
-            try:
-                d["timestamp"] = d["timestamp"].replace(tzinfo=None)
-            except:
-                pass
-        data.append(d)
-    df = pd.DataFrame(data)
-    if not df.empty:
-        df["timestamp"] = pd.to_datetime(df["timestamp"])
-    return df
-
-
-def generate_pdf_report(df):
-    """Generate PDF summary report"""
-    buffer = io.BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=A4)
-    styles = getSampleStyleSheet()
-    story = []
-
-    story.append(Paragraph("<b>PMSM Fault Diagnosis Report</b>", styles["Title"]))
-    story.append(Spacer(1, 12))
-    story.append(Paragraph(f"Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}", styles["Normal"]))
-    story.append(Spacer(1, 12))
-
-    if df.empty:
-        story.append(Paragraph("No data available.", styles["Normal"]))
-    else:
-        total = len(df)
-        avg_conf = df["confidence"].mean() * 100
-        uptime_hours = (df["timestamp"].max() - df["timestamp"].min()).total_seconds() / 3600
-
-        story.append(Paragraph(f"Total Samples Processed: {total}", styles["Normal"]))
-        story.append(Paragraph(f"Average Confidence: {avg_conf:.2f}%", styles["Normal"]))
-        story.append(Paragraph(f"System Uptime: {uptime_hours:.2f} hours", styles["Normal"]))
-        story.append(Spacer(1, 12))
-
-        fault_counts = df["fault_label"].value_counts().reset_index()
-        fault_counts.columns = ["Fault", "Count"]
-        data = [fault_counts.columns.to_list()] + fault_counts.values.tolist()
-        table = Table(data)
-        story.append(table)
-        story.append(Spacer(1, 12))
-
-    doc.build(story)
-    buffer.seek(0)
-    return buffer
-
-
-# -----------------------------
-# DASHBOARD LAYOUT
-# -----------------------------
-st.title("⚙️ PMSM Fault Diagnosis Dashboard")
-
-tab1, tab2, tab3, tab4 = st.tabs(["📊 Live Feed", "📈 Analytics", "📍 Locations", "🧾 Reports"])
-
-# -----------------------------
-# TAB 1 - LIVE FEED (Auto Refresh)
-# -----------------------------
-with tab1:
-    st.subheader("Real-Time Fault Verdicts")
-
-    # Refresh every 5 seconds
-    count = st_autorefresh(interval=5000, key="refresh_counter")
-
-    df = fetch_verdicts()
-    if df.empty:
-        st.warning("No verdicts yet...")
-    else:
-        live_df = df[["timestamp", "fault_label", "location", "description", "confidence", "source_file"]].head(15)
-        live_df["confidence"] = (live_df["confidence"] * 100).round(2).astype(str) + "%"
-        st.dataframe(live_df, use_container_width=True)
-
-# -----------------------------
-# TAB 2 - ANALYTICS
-# -----------------------------
-with tab2:
-    st.subheader("Fault Analytics")
-    df = fetch_verdicts()
-
-    if df.empty:
-        st.warning("No data to display yet.")
-    else:
-        col1, col2 = st.columns(2)
-
-        with col1:
-            fault_counts = df["fault_label"].value_counts().reset_index()
-            fault_counts.columns = ["Fault Type", "Count"]
-            fig = px.bar(fault_counts, x="Fault Type", y="Count", color="Fault Type", title="Fault Frequency")
-            st.plotly_chart(fig, use_container_width=True)
-
-        with col2:
-            fig = px.histogram(df, x="confidence", nbins=20, title="Confidence Distribution")
-            st.plotly_chart(fig, use_container_width=True)
-
-        st.divider()
-        st.subheader("Sensor Data (Time Series)")
-
-        if "features" in df.columns:
-            df_features = pd.json_normalize(df["features"])
-            df_combined = pd.concat([df[["timestamp"]], df_features], axis=1)
-            sensor = st.selectbox("Select Sensor", options=df_features.columns)
-            fig = px.line(df_combined, x="timestamp", y=sensor, title=f"{sensor} over Time")
-            st.plotly_chart(fig, use_container_width=True)
-        else:
-            st.info("No sensor features available in verdicts.")
-
-
-# -----------------------------
-# TAB 3 - LOCATIONS
-# -----------------------------
-with tab3:
-    st.subheader("Fault Locations")
-    df = fetch_verdicts()
-
-    if df.empty:
-        st.warning("No data to display yet.")
-    else:
-        loc_counts = df["location"].value_counts().reset_index()
-        loc_counts.columns = ["Location", "Count"]
-        fig = px.bar(loc_counts, x="Location", y="Count", color="Location", title="Fault Occurrence by Location")
-        st.plotly_chart(fig, use_container_width=True)
-
-
-# -----------------------------
-# TAB 4 - REPORTS
-# -----------------------------
-with tab4:
-    st.subheader("Generate Summary Report")
-
-    df = fetch_verdicts()
-
-    if st.button("🧾 Generate PDF Report"):
-        pdf = generate_pdf_report(df)
-        st.download_button(
-            label="📥 Download Report",
-            data=pdf,
-            file_name=f"pmsm_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf",
-            mime="application/pdf"
-        )
+import streamlit as st
+import pandas as pd
+import numpy as np
+import array
+import time
+from datetime import datetime
+import plotly.express as px
+import plotly.graph_objects as go
+import asyncio
+import threading
+import firebase_admin
+from firebase_admin import credentials, firestore, firestore_async
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import getSampleStyleSheet
+import tempfile
+
+# -----------------------------
+# FIREBASE SETUP
+# -----------------------------
+if not firebase_admin._apps:
+    cred = credentials.Certificate("pmsm-25905-firebase-adminsdk-fbsvc-eb25d9aa87.json")  
+    firebase_admin.initialize_app(cred)
+db = firestore_async.client()
+
+st.set_page_config(page_title="PMSM Fault Diagnosis Dashboard", layout="wide")
+
+# The 8 sensor features pushed by the data generator
+FEATURE_COLS = ("Ia", "Ib", "VDC", "IDC", "T1", "T2", "T3", "VD")
+
+# Cap on documents fetched per query; far more than any tab displays
+MAX_VERDICTS = 5000
+
+# -----------------------------
+# UTILS
+# -----------------------------
+@st.cache_resource
+def _firestore_loop():
+    """Dedicated event loop on a background thread for all Firestore I/O
+
+    The async client's gRPC channel binds to the loop that issues its first
+    RPC; keeping one long-lived loop means every later call (fragment
+    refreshes, aggregation queries) reuses a channel on a live loop instead
+    of one bound to a loop asyncio.run has already closed.
+    """
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    return loop
+
+
+def _run_async(coro):
+    """Run a coroutine on the persistent Firestore loop and wait for it"""
+    return asyncio.run_coroutine_threadsafe(coro, _firestore_loop()).result()
+
+
+# Verdict string fields accumulated as plain Python lists
+_LABEL_FIELDS = ("fault_label", "location", "description", "source_file")
+
+
+def _docs_to_df(docs):
+    """Convert Firestore document snapshots into a DataFrame, column by column"""
+    docs = list(docs)
+    if not docs:
+        return pd.DataFrame()
+
+    timestamps = []
+    confidences = array.array("d")
+    labels = {field: [] for field in _LABEL_FIELDS}
+    features = {col: array.array("d") for col in FEATURE_COLS}
+    has_features = False
+
+    for doc in docs:
+        d = doc._data  # decoded field dict; to_dict() would copy it per doc
+        nested = d.get("features")
+        if nested:
+            d = {**d, **nested}
+        timestamps.append(d.get("timestamp"))
+        conf = d.get("confidence")
+        confidences.append(float(conf) if conf is not None else float("nan"))
+        for field in _LABEL_FIELDS:
+            labels[field].append(d.get(field))
+        for col in FEATURE_COLS:
+            value = d.get(col)
+            if value is not None:
+                has_features = True
+                features[col].append(float(value))
+            else:
+                features[col].append(float("nan"))
+
+    # Vectorized tz strip; unparseable values become NaT. Categorical label
+    # columns keep value_counts on integer codes instead of string hashing.
+    columns = {
+        "timestamp": pd.to_datetime(timestamps, utc=True, errors="coerce").tz_localize(None),
+        "fault_label": pd.Categorical(labels["fault_label"]),
+        "location": pd.Categorical(labels["location"]),
+        "description": labels["description"],
+        "confidence": np.frombuffer(confidences, dtype=np.float64),
+        "source_file": labels["source_file"],
+    }
+    if has_features:
+        for col in FEATURE_COLS:
+            columns[col] = np.frombuffer(features[col], dtype=np.float64)
+    return pd.DataFrame(columns)
+
+
+@st.cache_data(ttl=300)
+def fetch_all_verdicts():
+    """Full reload: fetch every verdict from Firestore (heals cache drift)"""
+    verdicts_ref = db.collection("verdicts").order_by("timestamp", direction=firestore.Query.DESCENDING)
+    return _docs_to_df(_run_async(verdicts_ref.limit(MAX_VERDICTS).get()))
+
+
+def fetch_verdicts():
+    """Fetch only new verdicts and append them to the session-state cache"""
+    full_reload_due = time.time() - st.session_state.get("verdicts_loaded_at", 0) > 300
+
+    if "verdicts_df" not in st.session_state or full_reload_due:
+        df = fetch_all_verdicts()
+        st.session_state["verdicts_df"] = df
+        st.session_state["verdicts_loaded_at"] = time.time()
+        if not df.empty:
+            st.session_state["last_ts"] = df["timestamp"].max()
+        return df
+
+    # Incremental fetch: only documents newer than the last one we've seen
+    query = db.collection("verdicts")
+    last_ts = st.session_state.get("last_ts")
+    if last_ts is not None:
+        query = query.where("timestamp", ">", last_ts)
+    new_df = _docs_to_df(_run_async(query.order_by("timestamp").limit(MAX_VERDICTS).get()))
+
+    cached = st.session_state["verdicts_df"]
+    if not new_df.empty:
+        cached = pd.concat([new_df, cached], ignore_index=True)
+        cached = cached.sort_values("timestamp", ascending=False, ignore_index=True)
+        # concat degrades categoricals to strings when the two frames'
+        # category sets differ (new docs rarely cover every label); restore
+        for col in ("fault_label", "location"):
+            cached[col] = cached[col].astype("category")
+        st.session_state["verdicts_df"] = cached
+        st.session_state["last_ts"] = new_df["timestamp"].max()
+    return cached
+
+
+@st.cache_data(ttl=60)
+def fetch_counts(field, values):
+    """Count verdicts per value with concurrent Firestore aggregation queries"""
+    async def count_one(value):
+        result = await db.collection("verdicts").where(field, "==", value).count().get()
+        return value, int(result[0][0].value)
+
+    async def count_all():
+        return dict(await asyncio.gather(*(count_one(v) for v in values)))
+
+    if not values:
+        return {}
+    return _run_async(count_all())
+
+
+@st.cache_data(
+    ttl=60,
+    hash_funcs={pd.DataFrame: lambda d: (len(d), d["timestamp"].max() if not d.empty else None)},
+)
+def generate_pdf_report(df):
+    """Generate PDF summary report (cached until new verdicts arrive)"""
+    # Small reports stay in RAM; anything over 1 MB spills to disk
+    buffer = tempfile.SpooledTemporaryFile(max_size=1_048_576, mode="w+b")
+    doc = SimpleDocTemplate(buffer, pagesize=A4)
+    styles = getSampleStyleSheet()
+    story = []
+
+    story.append(Paragraph("<b>PMSM Fault Diagnosis Report</b>", styles["Title"]))
+    story.append(Spacer(1, 12))
+    story.append(Paragraph(f"Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}", styles["Normal"]))
+    story.append(Spacer(1, 12))
+
+    if df.empty:
+        story.append(Paragraph("No data available.", styles["Normal"]))
+    else:
+        total = len(df)
+        avg_conf = df["confidence"].mean() * 100
+        uptime_hours = (df["timestamp"].max() - df["timestamp"].min()).total_seconds() / 3600
+
+        story.append(Paragraph(f"Total Samples Processed: {total}", styles["Normal"]))
+        story.append(Paragraph(f"Average Confidence: {avg_conf:.2f}%", styles["Normal"]))
+        story.append(Paragraph(f"System Uptime: {uptime_hours:.2f} hours", styles["Normal"]))
+        story.append(Spacer(1, 12))
+
+        fault_counts = df["fault_label"].value_counts().reset_index()
+        fault_counts.columns = ["Fault", "Count"]
+        data = [fault_counts.columns.to_list()] + fault_counts.values.tolist()
+        table = Table(data)
+        story.append(table)
+        story.append(Spacer(1, 12))
+
+    doc.build(story)
+    buffer.seek(0)
+    with buffer:
+        return buffer.read()
+
+
+# -----------------------------
+# DASHBOARD LAYOUT
+# -----------------------------
+st.title("⚙️ PMSM Fault Diagnosis Dashboard")
+
+tab1, tab2, tab3, tab4 = st.tabs(["📊 Live Feed", "📈 Analytics", "📍 Locations", "🧾 Reports"])
+
+# Fetch once per rerun and share across all tabs
+df = fetch_verdicts()
+
+# -----------------------------
+# TAB 1 - LIVE FEED (Auto Refresh)
+# -----------------------------
+@st.fragment(run_every=5)
+def live_feed():
+    """Live verdict table; reruns alone every 5 s without re-running other tabs"""
+    df = fetch_verdicts()
+    if df.empty:
+        st.warning("No verdicts yet...")
+    else:
+        live_df = df[["timestamp", "fault_label", "location", "description", "confidence", "source_file"]].head(15)
+        live_df = live_df.assign(confidence=live_df["confidence"].mul(100))
+        st.dataframe(live_df.style.format({"confidence": "{:.2f}%"}), use_container_width=True)
+
+
+with tab1:
+    st.subheader("Real-Time Fault Verdicts")
+    live_feed()
+
+# -----------------------------
+# TAB 2 - ANALYTICS
+# -----------------------------
+with tab2:
+    st.subheader("Fault Analytics")
+
+    if df.empty:
+        st.warning("No data to display yet.")
+    else:
+        col1, col2 = st.columns(2)
+
+        with col1:
+            counts = fetch_counts("fault_label", tuple(df["fault_label"].dropna().unique()))
+            fig = go.Figure(go.Bar(x=list(counts), y=list(counts.values()), marker_color=px.colors.qualitative.Plotly))
+            fig.update_layout(title="Fault Frequency", xaxis_title="Fault Type", yaxis_title="Count")
+            st.plotly_chart(fig, use_container_width=True)
+
+        with col2:
+            # Documents without a confidence come through as NaN; np.histogram
+            # cannot autodetect a range over them
+            vals = df["confidence"].to_numpy()
+            vals = vals[np.isfinite(vals)]
+            if vals.size:
+                hist, edges = np.histogram(vals, bins=20)
+                fig = go.Figure(go.Bar(x=(edges[:-1] + edges[1:]) / 2, y=hist, width=np.diff(edges)))
+                fig.update_layout(title="Confidence Distribution", xaxis_title="confidence", yaxis_title="count", bargap=0)
+                st.plotly_chart(fig, use_container_width=True)
+            else:
+                st.info("No confidence values available.")
+
+        st.divider()
+        st.subheader("Sensor Data (Time Series)")
+
+        sensor_cols = [c for c in FEATURE_COLS if c in df.columns]
+        if sensor_cols:
+            sensor = st.selectbox("Select Sensor", options=sensor_cols)
+            plot_df = df
+            if len(plot_df) > 2000:
+                # Stride-downsample to ~2000 points before shipping to the browser
+                plot_df = plot_df.iloc[::len(plot_df) // 2000 + 1]
+            fig = go.Figure(go.Scattergl(x=plot_df["timestamp"], y=plot_df[sensor], mode="lines"))
+            fig.update_layout(title=f"{sensor} over Time", xaxis_title="timestamp", yaxis_title=sensor)
+            st.plotly_chart(fig, use_container_width=True)
+        else:
+            st.info("No sensor features available in verdicts.")
+
+
+# -----------------------------
+# TAB 3 - LOCATIONS
+# -----------------------------
+with tab3:
+    st.subheader("Fault Locations")
+
+    if df.empty:
+        st.warning("No data to display yet.")
+    else:
+        counts = fetch_counts("location", tuple(df["location"].dropna().unique()))
+        fig = go.Figure(go.Bar(x=list(counts), y=list(counts.values()), marker_color=px.colors.qualitative.Plotly))
+        fig.update_layout(title="Fault Occurrence by Location", xaxis_title="Location", yaxis_title="Count")
+        st.plotly_chart(fig, use_container_width=True)
+
+
+# -----------------------------
+# TAB 4 - REPORTS
+# -----------------------------
+with tab4:
+    st.subheader("Generate Summary Report")
+
+    if st.button("🧾 Generate PDF Report"):
+        pdf = generate_pdf_report(df)
+        st.download_button(
+            label="📥 Download Report",
+            data=pdf,
+            file_name=f"pmsm_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf",
+            mime="application/pdf"
+        )
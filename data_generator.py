@@ -1,110 +1,179 @@
-"""
-PMSM Fault Diagnosis - Data Generator
-Picks random sample from random fault CSV file and pushes to Firebase every 1 minute
-"""
-
-import firebase_admin
-from firebase_admin import credentials, firestore
-import pandas as pd
-import random
-import time
-import os
-from datetime import datetime
-
-# Initialize Firebase Admin SDK
-cred = credentials.Certificate('pmsm-25905-firebase-adminsdk-fbsvc-eb25d9aa87.json')  # Your key file
-firebase_admin.initialize_app(cred)
-db = firestore.client()
-
-# Define the assets directory
-ASSETS_DIR = '.'
-
-# List of fault CSV files (exclude dataset.csv as it's for training only)
-CSV_FILES = [
-    'NORMAL_OP.csv',
-    'HB1_OVER_TEMP.csv',
-    'HB2_HIGH_SIDE_SC.csv',
-    'HB2_HIGH_SIDE_OC.csv',
-    'HB3_OVER_TEMP.csv',
-    'HB1_LOW_SIDE_SC.csv',
-    'HB3_LOW_SIDE_OC.csv',
-    'HB12_OVER_TEMP.csv',
-    'HB3_HIGH_SIDE_SC.csv',
-]
-
-# The 8 sensor features (exclude FDD column)
-# The 8 sensor features (exclude FDD column)
-FEATURE_COLS = ['Ia', 'Ib', 'VDC', 'IDC', 'T1', 'T2', 'T3', 'VD']
-
-
-def load_csv_files():
-    """Load all CSV files into memory"""
-    data_dict = {}
-    for csv_file in CSV_FILES:
-        file_path = os.path.join(ASSETS_DIR, csv_file)
-        try:
-            df = pd.read_csv(file_path)
-            data_dict[csv_file] = df
-            print(f"Loaded {csv_file}: {len(df)} rows")
-        except Exception as e:
-            print(f"Error loading {csv_file}: {e}")
-    return data_dict
-
-def get_random_sample(data_dict):
-    """Select random CSV file and random row from it (exclude FDD column)"""
-    csv_file = random.choice(list(data_dict.keys()))
-    df = data_dict[csv_file]
-    
-    # Select random row
-    random_idx = random.randint(0, len(df) - 1)
-    row = df.iloc[random_idx]
-    
-    # Extract only the 8 features (skip FDD)
-    sample = {col: float(row[col]) for col in FEATURE_COLS if col in row}
-    sample['source_file'] = csv_file
-    sample['timestamp'] = firestore.SERVER_TIMESTAMP
-    
-    return sample
-
-def push_data(data_dict, interval=60):
-    """Push one random sample to Firestore every interval seconds (default: 60 = 1 minute)"""
-    print(f"\n Starting data stream (pushing every {interval}s / {interval/60} minute(s))...")
-    print("Press Ctrl+C to stop\n")
-    
-    try:
-        count = 0
-        while True:
-            # Get random sample
-            sample = get_random_sample(data_dict)
-            
-            # Push to Firestore
-            db.collection('raw_readings').add(sample)
-            count += 1
-            print(f"[{datetime.now().strftime('%H:%M:%S')}] #{count} Pushed sample from {sample['source_file']}")
-            print(f"   Features: Ia={sample['Ia']:.2f}, Ib={sample['Ib']:.2f}, VDC={sample['VDC']:.2f}")
-
-            
-            # Wait before next sample
-            time.sleep(interval)
-            
-    except KeyboardInterrupt:
-        print(f"\n✓ Data stream stopped. Total samples sent: {count}")
-    except Exception as e:
-        print(f"✗ Error: {e}")
-
-if __name__ == '__main__':
-    print("="*70)
-    print("PMSM FAULT DIAGNOSIS - DATA GENERATOR".center(70))
-    print("="*70)
-    
-    # Load all CSV files
-    print("\n Loading CSV files...")
-    data_dict = load_csv_files()
-    
-    if not data_dict:
-        print("\n ERROR: No CSV files loaded. Check assets directory.")
-    else:
-        print(f"\n Successfully loaded {len(data_dict)} CSV files")
-        
-        # Start pushing samples every 1 minute
-        push_data(data_dict, interval=60)
+"""
+PMSM Fault Diagnosis - Data Generator
+Picks random sample from random fault CSV file and pushes to Firebase every 1 minute
+"""
+
+import firebase_admin
+from firebase_admin import credentials, firestore
+import numpy as np
+import pandas as pd
+import random
+import time
+import os
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from numba import njit
+except ImportError:  # Numba is optional; sampling falls back to plain NumPy
+    njit = None
+
+# Initialize Firebase Admin SDK
+cred = credentials.Certificate('pmsm-25905-firebase-adminsdk-fbsvc-eb25d9aa87.json')  # Your key file
+firebase_admin.initialize_app(cred)
+db = firestore.client()
+
+# Define the assets directory
+ASSETS_DIR = '.'
+
+# List of fault CSV files (exclude dataset.csv as it's for training only)
+CSV_FILES = [
+    'NORMAL_OP.csv',
+    'HB1_OVER_TEMP.csv',
+    'HB2_HIGH_SIDE_SC.csv',
+    'HB2_HIGH_SIDE_OC.csv',
+    'HB3_OVER_TEMP.csv',
+    'HB1_LOW_SIDE_SC.csv',
+    'HB3_LOW_SIDE_OC.csv',
+    'HB12_OVER_TEMP.csv',
+    'HB3_HIGH_SIDE_SC.csv',
+]
+
+# The 8 sensor features (exclude FDD column)
+FEATURE_COLS = ('Ia', 'Ib', 'VDC', 'IDC', 'T1', 'T2', 'T3', 'VD')
+
+
+def _load_one_csv(csv_file):
+    """Read a single CSV into a float32 feature array (worker thread)
+
+    The parsed array is cached next to the CSV as .npy; later runs
+    memory-map the cache and skip CSV parsing entirely.
+    """
+    file_path = os.path.join(ASSETS_DIR, csv_file)
+    cache_path = file_path + '.npy'
+    try:
+        if os.path.exists(cache_path):
+            arr = np.load(cache_path, mmap_mode='r')
+            print(f"Loaded {csv_file} (cached): {arr.shape[0]} rows")
+            return csv_file, arr
+        df = pd.read_csv(
+            file_path,
+            engine='pyarrow',
+            usecols=FEATURE_COLS,
+            dtype={col: 'float32' for col in FEATURE_COLS},
+        )
+        arr = df[list(FEATURE_COLS)].to_numpy(dtype=np.float32)
+        np.save(cache_path, arr)
+        print(f"Loaded {csv_file}: {arr.shape[0]} rows")
+        return csv_file, arr
+    except Exception as e:
+        print(f"Error loading {csv_file}: {e}")
+        return csv_file, None
+
+def load_csv_files():
+    """Load all CSV files into memory in parallel"""
+    with ThreadPoolExecutor(max_workers=len(CSV_FILES)) as executor:
+        results = executor.map(_load_one_csv, CSV_FILES)
+    return {name: arr for name, arr in results if arr is not None}
+
+def get_random_sample(data_dict):
+    """Select random CSV file and random row from its feature array"""
+    csv_file = random.choice(list(data_dict.keys()))
+    arr = data_dict[csv_file]
+    
+    # Select random row (plain NumPy indexing, no Series construction)
+    row = arr[random.randrange(arr.shape[0])]
+    
+    sample = dict(zip(FEATURE_COLS, row.tolist()))
+    sample['source_file'] = csv_file
+    sample['timestamp'] = firestore.SERVER_TIMESTAMP
+    
+    return sample
+
+def stack_arrays(data_dict):
+    """Stack all per-file arrays into one matrix plus a parallel file-id array"""
+    names = list(data_dict.keys())
+    arr = np.concatenate([data_dict[name] for name in names])
+    file_ids = np.concatenate([
+        np.full(data_dict[name].shape[0], i, dtype=np.int64)
+        for i, name in enumerate(names)
+    ])
+    return names, arr, file_ids
+
+def _sample_batch_rows(arr, file_ids, n):
+    # Scalar randint per draw: Numba only types the one/two-argument forms
+    rows = np.empty((n, arr.shape[1]), dtype=arr.dtype)
+    ids = np.empty(n, dtype=file_ids.dtype)
+    for i in range(n):
+        idx = np.random.randint(arr.shape[0])
+        rows[i] = arr[idx]
+        ids[i] = file_ids[idx]
+    return rows, ids
+
+if njit is not None:
+    # JIT-compiled native loop; nogil lets a thread pool push concurrently
+    _sample_batch_rows = njit(nogil=True, cache=True)(_sample_batch_rows)
+
+def get_sample_batch(names, arr, file_ids, n):
+    """Draw n random samples in one call (for high-rate or catch-up pushes)"""
+    rows, ids = _sample_batch_rows(arr, file_ids, n)
+    samples = []
+    for row, file_id in zip(rows.tolist(), ids.tolist()):
+        sample = dict(zip(FEATURE_COLS, row))
+        sample['source_file'] = names[file_id]
+        sample['timestamp'] = firestore.SERVER_TIMESTAMP
+        samples.append(sample)
+    return samples
+
+def push_data(data_dict, interval=60, batch_size=1):
+    """Push random samples to Firestore every interval seconds (default: 60 = 1 minute)
+
+    With batch_size > 1, samples are committed in a single batched write
+    (one RPC instead of batch_size), for high-rate or catch-up operation.
+    Firestore batches allow up to 500 operations.
+    """
+    print(f"\n Starting data stream (pushing {batch_size} sample(s) every {interval}s)...")
+    print("Press Ctrl+C to stop\n")
+
+    try:
+        count = 0
+        readings_ref = db.collection('raw_readings')
+        names, arr, file_ids = stack_arrays(data_dict)
+        while True:
+            # Accumulate samples and commit them in one batched write
+            batch = db.batch()
+            samples = get_sample_batch(names, arr, file_ids, batch_size)
+            for sample in samples:
+                batch.set(readings_ref.document(), sample)
+            batch.commit()
+            count += len(samples)
+
+            sample = samples[-1]
+            print(f"[{datetime.now().strftime('%H:%M:%S')}] #{count} Pushed {len(samples)} sample(s), last from {sample['source_file']}")
+            print(f"   Features: Ia={sample['Ia']:.2f}, Ib={sample['Ib']:.2f}, VDC={sample['VDC']:.2f}")
+
+
+            # Wait before next batch
+            time.sleep(interval)
+            
+    except KeyboardInterrupt:
+        print(f"\n✓ Data stream stopped. Total samples sent: {count}")
+    except Exception as e:
+        print(f"✗ Error: {e}")
+
+if __name__ == '__main__':
+    print("="*70)
+    print("PMSM FAULT DIAGNOSIS - DATA GENERATOR".center(70))
+    print("="*70)
+    
+    # Load all CSV files
+    print("\n Loading CSV files...")
+    data_dict = load_csv_files()
+    
+    if not data_dict:
+        print("\n ERROR: No CSV files loaded. Check assets directory.")
+    else:
+        print(f"\n Successfully loaded {len(data_dict)} CSV files")
+        
+        # Start pushing samples every 1 minute
+        push_data(data_dict, interval=60)